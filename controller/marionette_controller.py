@@ -1,8 +1,11 @@
-import base64
+import collections
+import hashlib
 import time
+from urllib.parse import urlsplit
 
 import cv2
 import numpy as np
+import orjson
 from marionette_driver.marionette import Marionette
 from marionette_driver.by import By
 from marionette_driver.errors import NoSuchElementException, TimeoutException
@@ -10,6 +13,227 @@ from marionette_driver.wait import Wait
 from marionette_driver.keys import Keys
 from pytesseract import pytesseract
 
+try:
+    # In-process Tesseract bindings; avoids spawning a tesseract subprocess per OCR call.
+    from tesserocr import PyTessBaseAPI, PSM, RIL, iterate_level
+except ImportError:
+    PyTessBaseAPI = None
+
+
+# Page scripts are defined once at module level and reused for every call.
+_READY_STATE_SCRIPT = "return document.readyState;"
+_FOCUS_SCRIPT = "arguments[0].focus();"
+_READY_AND_RESOURCES_SCRIPT = "return [document.readyState, performance.getEntriesByType('resource').length];"
+# Identifies the current document: timeOrigin is fixed per document and changes on every navigation.
+_DOCUMENT_TOKEN_SCRIPT = "return performance.timeOrigin;"
+_HAS_VISUAL_CONTENT_SCRIPT = "return document.querySelector('img, canvas, svg, picture, video') !== null;"
+
+# Scroll the element into view, then click it; one round-trip in total. Instant scrolling only
+# needs one frame for layout; smooth scrolling waits for scrollend (capped at 1s).
+_SCROLL_AND_CLICK_SCRIPT = """
+const el = arguments[0], smooth = arguments[1], done = arguments[arguments.length - 1];
+let clicked = false;
+const clickOnce = () => {
+    if (clicked) return;
+    clicked = true;
+    // Errors here would escape the callback and leave the script hanging until its timeout.
+    try {
+        el.click();
+        done(true);
+    } catch (e) {
+        done(false);
+    }
+};
+el.scrollIntoView({block: 'center', inline: 'center', behavior: smooth ? 'smooth' : 'instant'});
+if (smooth) {
+    window.addEventListener('scrollend', clickOnce, {once: true});
+    setTimeout(clickOnce, 1000);
+} else {
+    requestAnimationFrame(clickOnce);
+}
+"""
+
+# Resolve once the document has loaded and the DOM has seen no mutations for quietMs,
+# or resolve false after maxMs.
+_WAIT_SETTLED_SCRIPT = """
+const quietMs = arguments[0], maxMs = arguments[1], done = arguments[arguments.length - 1];
+const start = performance.now();
+let lastMutation = start;
+const observer = new MutationObserver(() => { lastMutation = performance.now(); });
+observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+(function check() {
+    const now = performance.now();
+    if (document.readyState === 'complete' && now - lastMutation >= quietMs) {
+        observer.disconnect();
+        done(true);
+    } else if (now - start >= maxMs) {
+        observer.disconnect();
+        done(false);
+    } else {
+        setTimeout(check, 50);
+    }
+})();
+"""
+
+# Return [element, selector] for the first non-button match across a list of selectors, or null.
+_FIRST_SEARCH_INPUT_SCRIPT = """
+const selectors = arguments[0];
+for (const selector of selectors) {
+    let elements;
+    try {
+        elements = document.querySelectorAll(selector);
+    } catch (e) {
+        continue;
+    }
+    for (const el of elements) {
+        const type = el.getAttribute('type');
+        if (type !== 'submit' && type !== 'button') return [el, selector];
+    }
+}
+return null;
+"""
+
+# For each selector, return [selector, matchCount, elementAtIndex or null, elementText] in a single query.
+_NTH_MATCH_PER_SELECTOR_SCRIPT = """
+const selectors = arguments[0], index = arguments[1];
+const matches = [];
+for (const selector of selectors) {
+    let elements;
+    try {
+        elements = document.querySelectorAll(selector);
+    } catch (e) {
+        continue;
+    }
+    const el = elements.length > index ? elements[index] : null;
+    const text = el ? (el.innerText || el.textContent || '').trim().slice(0, 100) : '';
+    matches.push([selector, elements.length, el, text]);
+}
+return matches;
+"""
+
+_CLICK_FROM_POINT_SCRIPT = """
+var elem = document.elementFromPoint(arguments[0], arguments[1]);
+if (elem) {
+    elem.click();
+    return true;
+} else {
+    return false;
+}
+"""
+
+_FULL_DOM_SCRIPT = """
+function extractAllElements() {
+    // Elements that never produce a layout box; skip getBoundingClientRect for them.
+    const NON_RENDERED = new Set(['HEAD', 'SCRIPT', 'STYLE', 'META', 'LINK', 'TITLE', 'NOSCRIPT', 'TEMPLATE']);
+    const EMPTY_RECT = {top: 0, left: 0, width: 0, height: 0};
+    const results = [];
+    const root = document.documentElement;
+    if (!root) return results;
+
+    const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT);
+    let el = root;
+    while (el) {
+        const rect = NON_RENDERED.has(el.tagName.toUpperCase()) ? EMPTY_RECT : el.getBoundingClientRect();
+        const attrs = {};
+        const attributes = el.attributes;
+        for (let i = 0, n = attributes.length; i < n; i++) {
+            attrs[attributes[i].name] = attributes[i].value;
+        }
+        results.push({
+            tag: el.tagName.toLowerCase(),
+            text: el.textContent.trim(),
+            attributes: attrs,
+            position: {
+                top: rect.top,
+                left: rect.left,
+                width: rect.width,
+                height: rect.height
+            }
+        });
+        el = walker.nextNode();
+    }
+    return results;
+}
+return JSON.stringify(extractAllElements());
+"""
+
+_INTERACTIVE_SCRIPT = """
+function getInteractiveElements(maxElements) {
+    // Define a selector that covers most interactive elements.
+    const selectors = 'a, button, input, textarea, select, [role="button"], [role="link"], [role="search"], [role="textbox"], form';
+    const allElements = Array.from(document.querySelectorAll(selectors));
+
+    // Keep elements that are visible and either have non-empty text
+    // OR have at least one meaningful attribute (placeholder, aria-label, id, or href).
+    // The rect and trimmed text are measured once here and reused when building the output,
+    // so each element triggers a single getBoundingClientRect call.
+    const visibleElements = [];
+    for (const el of allElements) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0) continue;
+        const style = window.getComputedStyle(el);
+        if (style.visibility === 'hidden' || style.display === 'none') continue;
+        const text = el.textContent ? el.textContent.trim() : "";
+        const hasAttributes = el.getAttribute('placeholder') || el.getAttribute('aria-label') || el.id || el.href;
+        if (text.length > 0 || hasAttributes) visibleElements.push({el, rect, text});
+    }
+
+    // Sort elements by priority:
+    // Inputs and buttons first, then anchor tags, then others.
+    function priority(el) {
+        const tag = el.tagName.toLowerCase();
+        if (tag === 'input' || tag === 'button') return 1;
+        if (tag === 'a') return 2;
+        return 3;
+    }
+    visibleElements.sort((a, b) => priority(a.el) - priority(b.el));
+
+    // Limit to maxElements and map to a simplified structure.
+    return visibleElements.slice(0, maxElements).map(({el, rect, text}) => {
+        const textContent = text.length > 100 ? text.slice(0, 100) + '...' : text;
+        return {
+            tag: el.tagName.toLowerCase(),
+            text: textContent,
+            attributes: {
+                id: el.id || null,
+                name: el.name || null,
+                class: el.className || null,
+                placeholder: el.getAttribute('placeholder') || null,
+                'aria-label': el.getAttribute('aria-label') || null,
+                href: el.href || null,
+                title: el.getAttribute('title') || null
+            },
+            position: {
+                top: Math.round(rect.top),
+                left: Math.round(rect.left)
+            }
+        };
+    });
+}
+return JSON.stringify(getInteractiveElements(arguments[0] || 200));
+"""
+
+
+def _parse_tesseract_tsv(tsv: str) -> dict:
+    """
+    Parse Tesseract TSV output, keeping only the columns the OCR lookup uses
+    (left, top, width, height, conf, text) instead of building all twelve.
+    """
+    data = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []}
+    lines = tsv.splitlines()
+    for line in lines[1:]:
+        # level page block par line word left top width height conf text
+        fields = line.split('\t', 11)
+        if len(fields) < 12:
+            continue
+        data['left'].append(int(fields[6]))
+        data['top'].append(int(fields[7]))
+        data['width'].append(int(fields[8]))
+        data['height'].append(int(fields[9]))
+        data['conf'].append(float(fields[10]))
+        data['text'].append(fields[11])
+    return data
+
 
 class EnhancedMarionetteController:
     def __init__(self, host='localhost', port=2828):
@@ -17,6 +241,25 @@ class EnhancedMarionetteController:
         self.port = port
         self.client = None
         self.timeout = 10
+        self._tess_api = None
+        # OCR results keyed by a hash of the screenshot bytes (bounded, LRU order).
+        self._ocr_cache = collections.OrderedDict()
+        self._ocr_cache_max = 64
+        # Selector lists per (kind, host), with the selector that last worked on that host moved to the front.
+        self._selector_order = {}
+        # Per-tile OCR boxes keyed by tile shape + content hash, so unchanged regions are not re-read.
+        self._tile_cache = collections.OrderedDict()
+        self._tile_cache_max = 512
+        self._ocr_tile_grid = 4
+        # Pixels each tile extends past its grid cell, so words crossing a cut are read whole by one tile.
+        self._ocr_tile_margin = 48
+        # Reusable output buffers for upscaled OCR tiles, keyed by shape.
+        self._ocr_bufs = {}
+
+    def __del__(self):
+        if getattr(self, "_tess_api", None) is not None:
+            self._tess_api.End()
+            self._tess_api = None
 
     def connect(self, timeout=30):
         """Connect to Firefox Marionette."""
@@ -24,6 +267,8 @@ class EnhancedMarionetteController:
             print(f"Connecting to Marionette at {self.host}:{self.port}...")
             self.client = Marionette(host=self.host, port=self.port)
             self.client.start_session(timeout=timeout)
+            # Set the script timeout once for the session instead of per call.
+            self.client.set_script_timeout(self.timeout * 1000)
             print("Marionette session started successfully.")
             return {"status": "success", "message": "Connected to Firefox"}
         except ConnectionRefusedError:
@@ -42,14 +287,94 @@ class EnhancedMarionetteController:
                 url = 'https://' + url
 
             self.client.navigate(url)
+            # Tiles from the previous page are unlikely to recur
+            self._tile_cache.clear()
             # Wait for page load to complete
-            Wait(self.client).until(lambda _: self.client.execute_script('return document.readyState') == 'complete')
+            Wait(self.client).until(lambda _: self.client.execute_script(_READY_STATE_SCRIPT) == 'complete')
             return {"status": "success", "message": f"Navigated to {url}"}
         except TimeoutException:
             return {"status": "error", "message": f"Timeout while navigating to {url}"}
         except Exception as e:
             return {"status": "error", "message": f"Navigation failed: {str(e)}"}
 
+    def _ordered_selectors(self, kind, url, default_selectors):
+        """Return the selector list for this host, with the last successful selector first."""
+        return self._selector_order.get((kind, urlsplit(url).hostname), default_selectors)
+
+    def _remember_selector(self, kind, url, selectors, used_selector):
+        """Move the selector that just worked to the front of the list for this host."""
+        self._selector_order[(kind, urlsplit(url).hostname)] = (
+            [used_selector] + [s for s in selectors if s != used_selector]
+        )
+
+    def wait_for_ready(self, timeout=3.0, quiet_ms=200, previous_document=None, nav_grace=1.0):
+        """
+        Poll until document.readyState is 'complete' and the number of loaded resources has not
+        changed for quiet_ms, up to timeout seconds. Returns True if the page became ready in time.
+        With previous_document (see document_token), the old page is first given up to nav_grace
+        seconds to be replaced, since a JS click returns before the navigation it starts commits.
+        """
+        deadline = time.monotonic() + timeout
+        if previous_document is not None:
+            self._wait_for_new_document(previous_document, min(nav_grace, timeout))
+        last_count = None
+        stable_since = time.monotonic()
+        while time.monotonic() < deadline:
+            try:
+                state, count = self.client.execute_script(_READY_AND_RESOURCES_SCRIPT)
+            except Exception:
+                # The document can be replaced mid-navigation; keep polling.
+                state, count = None, None
+            now = time.monotonic()
+            if state == 'complete' and count == last_count:
+                if now - stable_since >= quiet_ms / 1000:
+                    return True
+            else:
+                stable_since = now
+            last_count = count
+            time.sleep(0.05)
+        return False
+
+    def document_token(self):
+        """Return a value identifying the current document, or None if it cannot be read (e.g. mid-navigation)."""
+        try:
+            return self.client.execute_script(_DOCUMENT_TOKEN_SCRIPT)
+        except Exception:
+            return None
+
+    def _wait_for_new_document(self, previous_document, grace):
+        """
+        Poll until the document identified by previous_document (from document_token) has been replaced,
+        up to grace seconds. Returns True if a new document was seen.
+        """
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline:
+            token = self.document_token()
+            if token is not None and token != previous_document:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def _wait_settled(self, timeout=5, quiet_ms=300, previous_document=None, nav_grace=3.0):
+        """
+        Wait until document.readyState is 'complete' and the DOM has been free of mutations
+        for quiet_ms, up to timeout seconds. Returns True if the page settled in time.
+        Pass previous_document (taken before the action) when the action may navigate: the old page is
+        already settled, so it is first given up to nav_grace seconds to be replaced.
+        """
+        deadline = time.monotonic() + timeout
+        if previous_document is not None:
+            self._wait_for_new_document(previous_document, min(nav_grace, timeout))
+        while True:
+            remaining_ms = int((deadline - time.monotonic()) * 1000)
+            if remaining_ms <= 0:
+                return False
+            try:
+                return bool(self.client.execute_async_script(_WAIT_SETTLED_SCRIPT, [quiet_ms, remaining_ms]))
+            except Exception:
+                # A navigation can unload the document mid-script; retry against the new page.
+                time.sleep(0.05)
+
     def find_element(self, selector, by=By.CSS_SELECTOR):
         """Find an element using Marionette native command."""
         try:
@@ -61,25 +386,27 @@ class EnhancedMarionetteController:
             print(f"Error finding element {selector}: {e}")
             return None
 
-    def click(self, selector, by=By.CSS_SELECTOR):
-        """Click an element using Marionette native command."""
+    def click(self, selector, by=By.CSS_SELECTOR, smooth_scroll=False):
+        """
+        Click an element, scrolling it into view first. Scrolling is instant by default;
+        pass smooth_scroll=True when the scroll animation should be visible (e.g. for screenshots).
+        """
         try:
             element = self.find_element(selector, by)
             if not element:
                 return {"status": "error", "message": f"Element not found: {selector}"}
 
-            # Scroll the element into view, centering it
-            self.client.execute_script(
-                "arguments[0].scrollIntoView({block: 'center', inline: 'center', behavior: 'smooth'});",
-                [element]
-            )
-            time.sleep(1)
-
-            element.click()
+            # Scroll the element into view, centering it, and click in the same script call
+            if not self._scroll_and_click(element, smooth_scroll):
+                return {"status": "error", "message": f"Click failed: {selector}"}
             return {"status": "success", "message": f"Clicked element: {selector}"}
         except Exception as e:
             return {"status": "error", "message": f"Click failed: {str(e)}"}
 
+    def _scroll_and_click(self, element, smooth=False):
+        """Scroll an element into view and click it with a single async script; returns True on success."""
+        return bool(self.client.execute_async_script(_SCROLL_AND_CLICK_SCRIPT, [element, smooth]))
+
     def input_text(self, selector, text, by=By.CSS_SELECTOR):
         """Type text into an element using Marionette native commands."""
         try:
@@ -133,37 +460,49 @@ class EnhancedMarionetteController:
                 "form input[type='text']"  # Generic form input
             ]
 
+            # Start with the selector that worked last time on this host
+            search_selectors = self._ordered_selectors("search", current_url, search_selectors)
+
             # Try to find a search input
             search_input = None
             used_selector = None
 
-            for selector in search_selectors:
-                try:
-                    print(f"Trying selector: {selector}")
-                    elements = self.client.find_elements("css selector", selector)
-                    if elements and len(elements) > 0:
-                        # Make sure we're not selecting a button or submit input
-                        for element in elements:
-                            element_type = element.get_attribute("type")
-                            if element_type != "submit" and element_type != "button":
-                                search_input = element
-                                used_selector = selector
-                                print(f"Found search input with selector: {selector}")
+            try:
+                # Try every selector inside the page in a single round-trip
+                match = self.client.execute_script(_FIRST_SEARCH_INPUT_SCRIPT, [search_selectors])
+                if match:
+                    search_input, used_selector = match
+                    print(f"Found search input with selector: {used_selector}")
+            except Exception as batch_error:
+                print(f"Batched selector lookup failed: {batch_error}")
+                for selector in search_selectors:
+                    try:
+                        print(f"Trying selector: {selector}")
+                        elements = self.client.find_elements("css selector", selector)
+                        if elements and len(elements) > 0:
+                            # Make sure we're not selecting a button or submit input
+                            for element in elements:
+                                element_type = element.get_attribute("type")
+                                if element_type != "submit" and element_type != "button":
+                                    search_input = element
+                                    used_selector = selector
+                                    print(f"Found search input with selector: {selector}")
+                                    break
+
+                            if search_input:
                                 break
-
-                        if search_input:
-                            break
-                except Exception as e:
-                    print(f"Selector {selector} failed: {e}")
-                    continue
+                    except Exception as e:
+                        print(f"Selector {selector} failed: {e}")
+                        continue
 
             if not search_input:
                 return {"status": "error", "message": f"Could not find search box on {current_url}"}
+            self._remember_selector("search", current_url, search_selectors, used_selector)
 
             # Try to scroll to the element in a way that works with fixed elements
             try:
                 # Try using JavaScript to focus the element directly without scrolling
-                self.client.execute_script("arguments[0].focus();", [search_input])
+                self.client.execute_script(_FOCUS_SCRIPT, [search_input])
             except Exception as e:
                 print(f"Focus attempt failed: {e}")
                 try:
@@ -201,6 +540,7 @@ class EnhancedMarionetteController:
                     return {"status": "error", "message": f"Could not enter search query: {str(js_input_error)}"}
 
             # Submit the search
+            previous_document = self.document_token()
             try:
                 search_input.send_keys(Keys.RETURN)
                 print("Pressed Enter to submit search")
@@ -240,8 +580,8 @@ class EnhancedMarionetteController:
                         print(f"JavaScript form submit failed: {js_submit_error}")
                         return {"status": "error", "message": f"Could not submit search: {str(js_submit_error)}"}
 
-            # Wait for results
-            time.sleep(3)
+            # Wait for results; Enter returns before the results page has replaced the current one
+            self._wait_settled(previous_document=previous_document)
 
             return {
                 "status": "success",
@@ -269,48 +609,40 @@ class EnhancedMarionetteController:
 
         try:
             # Wait for results to load
-            time.sleep(3)
+            self._wait_settled()
 
             # Get current URL for logging
             current_url = self.client.get_url()
             print(f"Looking for result #{index + 1} on {current_url}")
+            selectors = self._ordered_selectors("result", current_url, selectors)
 
-            for selector in selectors:
+            # Query every selector inside the page in a single round-trip
+            matches = self.client.execute_script(_NTH_MATCH_PER_SELECTOR_SCRIPT, [selectors, index])
+
+            for selector, count, target_element, element_text in matches:
                 try:
-                    print(f"Trying selector: {selector}")
-                    elements = self.client.find_elements(By.CSS_SELECTOR, selector)
-                    print(f"Found {len(elements)} elements with selector: {selector}")
+                    print(f"Found {count} elements with selector: {selector}")
 
                     # Skip if not enough results
-                    if not elements or len(elements) <= index:
+                    if target_element is None:
                         print(f"Not enough results with {selector}, needed at least {index + 1}")
                         continue
 
-                    # Get target element
-                    target_element = elements[index]
-
-                    # Get element text for reporting
-                    try:
-                        element_text = target_element.text
-                        if not element_text:
-                            element_text = target_element.get_attribute("textContent")
-                        element_text = element_text.strip() if element_text else "Unknown"
-                        if len(element_text) > 50:
-                            element_text = element_text[:50] + "..."
-                    except:
-                        element_text = "Unknown"
+                    # Element text for reporting was fetched with the batched query
+                    element_text = element_text or "Unknown"
+                    if len(element_text) > 50:
+                        element_text = element_text[:50] + "..."
 
                     print(f"Found result #{index + 1}: {element_text}")
 
-                    # Simple scroll
-                    self.client.execute_script("window.scrollBy(0, window.innerHeight/2);")
-                    time.sleep(1)
-
-                    # Try clicking directly
+                    # Scroll into view and click in a single round-trip
                     try:
-                        target_element.click()
+                        previous_document = self.document_token()
+                        if not self._scroll_and_click(target_element):
+                            raise Exception("click script did not complete")
                         print(f"Clicked on result #{index + 1}")
-                        time.sleep(3)  # Wait for page load
+                        self._remember_selector("result", current_url, selectors, selector)
+                        self._wait_settled(previous_document=previous_document)  # Wait for page load
                         return {"status": "success", "message": f"Clicked result #{index + 1}: {element_text}"}
                     except Exception as e:
                         print(f"Direct click failed: {e}")
@@ -324,33 +656,8 @@ class EnhancedMarionetteController:
             return {"status": "error", "message": f"Failed to click search result: {str(e)}"}
 
     def get_full_dom_context(self):
-
-        script = """
-        function extractAllElements() {
-            const elements = Array.from(document.querySelectorAll("*"));
-            return elements.map(el => {
-                const rect = el.getBoundingClientRect();
-                let attrs = {};
-                for (let attr of el.attributes) {
-                    attrs[attr.name] = attr.value;
-                }
-                return {
-                    tag: el.tagName.toLowerCase(),
-                    text: el.textContent.trim(),
-                    attributes: attrs,
-                    position: {
-                        top: rect.top,
-                        left: rect.left,
-                        width: rect.width,
-                        height: rect.height
-                    }
-                };
-            });
-        }
-        return extractAllElements();
-        """
         try:
-            return self.client.execute_script(script)
+            return orjson.loads(self.client.execute_script(_FULL_DOM_SCRIPT))
         except Exception as e:
             print("Error extracting full DOM context:", e)
             return []
@@ -362,68 +669,23 @@ class EnhancedMarionetteController:
         with meaningful attributes (like href, placeholder, or aria-label) are included.
         The maximum number of elements returned is increased (default=200).
         """
-        script = """
-        function getInteractiveElements(maxElements) {
-            // Define a selector that covers most interactive elements.
-            const selectors = 'a, button, input, textarea, select, [role="button"], [role="link"], [role="search"], [role="textbox"], form';
-            const allElements = Array.from(document.querySelectorAll(selectors));
-
-            // Filter for elements that are visible and either have non-empty text
-            // OR have at least one meaningful attribute (placeholder, aria-label, id, or href).
-            const visibleElements = allElements.filter(el => {
-                const rect = el.getBoundingClientRect();
-                const style = window.getComputedStyle(el);
-                const isVisible = rect.width > 0 && rect.height > 0 &&
-                                  style.visibility !== 'hidden' &&
-                                  style.display !== 'none';
-                const textPresent = el.textContent && el.textContent.trim().length > 0;
-                const hasAttributes = el.getAttribute('placeholder') || el.getAttribute('aria-label') || el.id || el.href;
-                return isVisible && (textPresent || hasAttributes);
-            });
-
-            // Sort elements by priority:
-            // Inputs and buttons first, then anchor tags, then others.
-            visibleElements.sort((a, b) => {
-                function priority(el) {
-                    const tag = el.tagName.toLowerCase();
-                    if (tag === 'input' || tag === 'button') return 1;
-                    if (tag === 'a') return 2;
-                    return 3;
-                }
-                return priority(a) - priority(b);
-            });
-
-            // Limit to maxElements and map to a simplified structure.
-            return visibleElements.slice(0, maxElements).map(el => {
-                let textContent = el.textContent ? el.textContent.trim() : "";
-                if (textContent.length > 100) textContent = textContent.substring(0, 100) + '...';
-                return {
-                    tag: el.tagName.toLowerCase(),
-                    text: textContent,
-                    attributes: {
-                        id: el.id || null,
-                        name: el.name || null,
-                        class: el.className || null,
-                        placeholder: el.getAttribute('placeholder') || null,
-                        'aria-label': el.getAttribute('aria-label') || null,
-                        href: el.href || null,
-                        title: el.getAttribute('title') || null
-                    },
-                    position: {
-                        top: Math.round(el.getBoundingClientRect().top),
-                        left: Math.round(el.getBoundingClientRect().left)
-                    }
-                };
-            });
-        }
-        return getInteractiveElements(arguments[0] || 200);
-        """
         try:
-            return self.client.execute_script(script, [max_elements])
+            return orjson.loads(self.client.execute_script(_INTERACTIVE_SCRIPT, [max_elements]))
         except Exception as e:
             print(f"Error getting DOM context: {e}")
             return []
 
+    def has_visual_content(self) -> bool:
+        """
+        True if the page has image-like elements whose rendered text only OCR can see.
+        Errs on the side of True when the check itself fails.
+        """
+        try:
+            return bool(self.client.execute_script(_HAS_VISUAL_CONTENT_SCRIPT))
+        except Exception as e:
+            print(f"Error checking for visual content: {e}")
+            return True
+
     def submit_search(self, selector):
         """
         Submit the search by sending the Enter key to the search input.
@@ -434,11 +696,12 @@ class EnhancedMarionetteController:
             if element:
                 from marionette_driver.keys import Keys
                 # Ensure the element is focused before sending the key events
-                self.client.execute_script("arguments[0].focus();", [element])
+                self.client.execute_script(_FOCUS_SCRIPT, [element])
                 time.sleep(0.5)
+                previous_document = self.document_token()
                 # Simulate a keydown, keypress, and keyup sequence for the Enter key
                 element.send_keys(Keys.RETURN)
-                time.sleep(3)
+                self._wait_settled(previous_document=previous_document)
                 return {"status": "success", "message": f"Submitted search via Enter on {selector}"}
             else:
                 return {"status": "error", "message": f"Search input not found: {selector}"}
@@ -451,16 +714,7 @@ class EnhancedMarionetteController:
         Uses document.elementFromPoint to find the element and triggers its click event.
         """
         try:
-            script = """
-                var elem = document.elementFromPoint(arguments[0], arguments[1]);
-                if (elem) {
-                    elem.click();
-                    return true;
-                } else {
-                    return false;
-                }
-            """
-            result = self.client.execute_script(script, [x, y])
+            result = self.client.execute_script(_CLICK_FROM_POINT_SCRIPT, [x, y])
             if result:
                 return {"status": "success", "message": f"Clicked at coordinates ({x}, {y})"}
             else:
@@ -468,9 +722,111 @@ class EnhancedMarionetteController:
         except Exception as e:
             return {"status": "error", "message": f"Click by coordinates failed: {str(e)}"}
 
+    def _get_tess_api(self):
+        """Lazily create a Tesseract API instance so eng.traineddata is loaded only once."""
+        if self._tess_api is None:
+            self._tess_api = PyTessBaseAPI(lang='eng', psm=PSM.SPARSE_TEXT)
+        return self._tess_api
+
+    def _run_ocr(self, gray) -> dict:
+        """
+        Run OCR on a grayscale image and return word boxes in pytesseract's dict layout
+        (text, conf, left, top, width, height). Uses tesserocr when installed and falls
+        back to pytesseract otherwise.
+        """
+        if PyTessBaseAPI is None:
+            return _parse_tesseract_tsv(pytesseract.image_to_data(gray))
+
+        api = self._get_tess_api()
+        gray = np.ascontiguousarray(gray)
+        height, width = gray.shape[:2]
+        api.SetImageBytes(gray.tobytes(), width, height, 1, width)
+        api.Recognize()
+
+        data = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []}
+        for word in iterate_level(api.GetIterator(), RIL.WORD):
+            text = word.GetUTF8Text(RIL.WORD)
+            box = word.BoundingBox(RIL.WORD)
+            if text is None or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            data['text'].append(text)
+            data['conf'].append(int(word.Confidence(RIL.WORD)))
+            data['left'].append(x1)
+            data['top'].append(y1)
+            data['width'].append(x2 - x1)
+            data['height'].append(y2 - y1)
+        return data
+
+    def _ocr_tile(self, tile, scale: int) -> list:
+        """
+        Upscale and binarize a single tile, OCR it, and return its word boxes as
+        (text, conf, left, top, width, height) tuples in unscaled tile coordinates.
+        """
+        if scale > 1:
+            shape = (tile.shape[0] * scale, tile.shape[1] * scale)
+            buf = self._ocr_bufs.get(shape)
+            if buf is None:
+                buf = self._ocr_bufs[shape] = np.empty(shape, dtype=np.uint8)
+            work = cv2.resize(np.ascontiguousarray(tile), (shape[1], shape[0]), dst=buf,
+                              interpolation=cv2.INTER_CUBIC)
+        else:
+            work = np.array(tile)
+        cv2.threshold(work, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU, dst=work)
+
+        data = self._run_ocr(work)
+        return [
+            (text, conf, left // scale, top // scale, width // scale, height // scale)
+            for text, conf, left, top, width, height in zip(
+                data['text'], data['conf'], data['left'], data['top'], data['width'], data['height'])
+        ]
+
+    def _ocr_tiles(self, gray) -> dict:
+        """
+        Split the grayscale viewport into a grid of overlapping tiles and OCR only the tiles whose
+        content hash is not already cached. Boxes are merged back into viewport coordinates, each kept
+        only by the tile whose grid cell holds its centre.
+        """
+        # Upscale small viewports so Tesseract does less internal resampling
+        scale = 2 if gray.shape[1] < 1600 else 1
+        height, width = gray.shape[:2]
+        tile_h = -(-height // self._ocr_tile_grid)
+        tile_w = -(-width // self._ocr_tile_grid)
+        margin = self._ocr_tile_margin
+
+        data = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []}
+        for y in range(0, height, tile_h):
+            for x in range(0, width, tile_w):
+                x0 = max(x - margin, 0)
+                y0 = max(y - margin, 0)
+                tile = gray[y0:y + tile_h + margin, x0:x + tile_w + margin]
+                key = (tile.shape, scale, hashlib.blake2b(tile.tobytes(), digest_size=8).digest())
+                boxes = self._tile_cache.get(key)
+                if boxes is not None:
+                    self._tile_cache.move_to_end(key)
+                else:
+                    boxes = self._ocr_tile(tile, scale)
+                    self._tile_cache[key] = boxes
+                    if len(self._tile_cache) > self._tile_cache_max:
+                        self._tile_cache.popitem(last=False)
+
+                for text, conf, left, top, box_w, box_h in boxes:
+                    left += x0
+                    top += y0
+                    # Drop boxes centred in a neighbour's cell; that tile reports them, so overlaps add no duplicates
+                    if not (x <= left + box_w // 2 < x + tile_w and y <= top + box_h // 2 < y + tile_h):
+                        continue
+                    data['text'].append(text)
+                    data['conf'].append(conf)
+                    data['left'].append(left)
+                    data['top'].append(top)
+                    data['width'].append(box_w)
+                    data['height'].append(box_h)
+        return data
+
     def get_target_coordinates_ocr(self, target_text: str, confidence_threshold: int = 60) -> dict:
         """
-        Capture the current screenshot, use pytesseract OCR to detect text, and return the center
+        Capture the current screenshot, use Tesseract OCR to detect text, and return the center
         coordinates of the first bounding box that contains the target text.
 
         Args:
@@ -481,37 +837,47 @@ class EnhancedMarionetteController:
           A dictionary with {"x": int, "y": int} if found, or an empty dict if not.
         """
         try:
-            # Capture screenshot as a base64-encoded string
-            screenshot_b64 = self.client.screenshot(format='base64')
-            # Decode the base64 string
-            screenshot_bytes = base64.b64decode(screenshot_b64)
-            # Convert to numpy array and decode image with OpenCV
-            nparr = np.frombuffer(screenshot_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-            # Convert image to grayscale for better OCR performance
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            # Run OCR with pytesseract to get detailed data
-            data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
-
-            num_boxes = len(data['text'])
-            for i in range(num_boxes):
-                text = data['text'][i].strip()
-                try:
-                    conf = int(data['conf'][i])
-                except:
-                    conf = 0
-                # Check if OCR confidence is above threshold and target_text appears in the detected text
-                if conf > confidence_threshold and target_text.lower() in text.lower():
-                    left = data['left'][i]
-                    top = data['top'][i]
-                    width = data['width'][i]
-                    height = data['height'][i]
-                    # Calculate the center coordinates
-                    x_center = left + width // 2
-                    y_center = top + height // 2
-                    print(f"OCR detected '{text}' at ({x_center}, {y_center}) with confidence {conf}")
-                    return {"x": x_center, "y": y_center}
+            # Capture the visible viewport as raw PNG bytes; coordinates must match
+            # the viewport space used by document.elementFromPoint.
+            screenshot_bytes = self.client.screenshot(format='binary', full=False)
+            key = hashlib.blake2b(screenshot_bytes, digest_size=16).digest()
+            cached = self._ocr_cache.get(key)
+            if cached is not None:
+                # Viewport unchanged since a previous call; reuse its OCR output.
+                self._ocr_cache.move_to_end(key)
+                data = cached
+            else:
+                # Convert to numpy array and decode straight to grayscale for better OCR performance
+                nparr = np.frombuffer(screenshot_bytes, np.uint8)
+                gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+                # Run OCR tile by tile, reusing results for tiles that have not changed
+                data = self._ocr_tiles(gray)
+                self._ocr_cache[key] = data
+                if len(self._ocr_cache) > self._ocr_cache_max:
+                    self._ocr_cache.popitem(last=False)
+
+            # Vectorise the box geometry and confidence
+            left = np.asarray(data['left'], dtype=np.int32)
+            top = np.asarray(data['top'], dtype=np.int32)
+            width = np.asarray(data['width'], dtype=np.int32)
+            height = np.asarray(data['height'], dtype=np.int32)
+            conf = np.asarray(data['conf'], dtype=np.float32).astype(np.int32)
+            # Calculate the center coordinates for every box at once
+            x_centers = left + width // 2
+            y_centers = top + height // 2
+
+            # Check OCR confidence and whether target_text appears in the detected text in one C-level pass
+            texts = np.array(data['text'], dtype=str)
+            hits = np.char.find(np.char.lower(texts), target_text.lower()) >= 0
+            hits &= conf > confidence_threshold
+            matches = np.flatnonzero(hits)
+            if matches.size:
+                i = matches[0]
+                text = texts[i].strip()
+                x_center = int(x_centers[i])
+                y_center = int(y_centers[i])
+                print(f"OCR detected '{text}' at ({x_center}, {y_center}) with confidence {conf[i]}")
+                return {"x": x_center, "y": y_center}
             print(f"OCR did not find any text matching '{target_text}' with confidence above {confidence_threshold}")
             return {}
         except Exception as e:
@@ -1,8 +1,10 @@
+import asyncio
 import re
 import time
+from collections import deque
 from typing import Dict, Any, List
 from controller.marionette_controller import EnhancedMarionetteController
-from parser.command_parser import CommandParser
+from parser.command_parser import dom_fingerprint, get_parser
 
 
 class CommandExecutor:
@@ -10,8 +12,23 @@ class CommandExecutor:
 
     def __init__(self, host='localhost', port=2828):
         self.controller = EnhancedMarionetteController(host=host, port=port)
-        self.parser = CommandParser(api_key="<api-key>")
+        self.parser = get_parser()
         self.connected = False
+        # OCR coordinates keyed by (url, target_text) -> (monotonic timestamp, coords); short-lived.
+        self._ocr_cache = {}
+        self._ocr_cache_ttl = 5.0
+        # How often the OCR fallback is skipped, run, and actually finds the target; used to tune _ocr_may_find.
+        self._ocr_stats = {"skipped": 0, "runs": 0, "hits": 0}
+        # Action name -> bound step handler, built once.
+        self._handlers = {
+            "navigate": self._handle_navigate,
+            "click": self._handle_click,
+            "search": self._handle_search,
+            "input": self._handle_input,
+            "extract": self._handle_extract,
+            "wait": self._handle_wait,
+            "complete": self._handle_complete,
+        }
 
     def connect(self):
         """Ensure connection to the browser."""
@@ -21,86 +38,128 @@ class CommandExecutor:
             return result
         return {"status": "success", "message": "Already connected"}
 
-    def _execute_step(self, step: dict) -> dict:
+    def _ocr_may_find(self, target_text: str, dom_context) -> bool:
+        """
+        Cheap check before running OCR: the target can only be on screen if it is part of some
+        element's text or the page has image/canvas content that could render it.
+        The DOM context holds interactive elements only, so image content is asked of the page.
+        Without a DOM context, assume OCR may succeed.
+        """
+        if not isinstance(dom_context, list):
+            return True
+        target = target_text.lower()
+        if any(target in (element.get("text") or "").lower() for element in dom_context):
+            return True
+        return self.controller.has_visual_content()
+
+    def _get_ocr_coordinates(self, target_text: str) -> dict:
+        """Return OCR coordinates for target_text, reusing a result for the same URL from the last few seconds."""
+        key = (self.controller.client.get_url(), target_text)
+        cached = self._ocr_cache.get(key)
+        if cached and time.monotonic() - cached[0] < self._ocr_cache_ttl:
+            return cached[1]
+        ocr_coords = self.controller.get_target_coordinates_ocr(target_text)
+        # Misses are not cached: a recovery retry must re-run OCR on content that has just appeared.
+        if ocr_coords:
+            self._ocr_cache[key] = (time.monotonic(), ocr_coords)
+        return ocr_coords
+
+    def _execute_step(self, step: dict, dom_context=None) -> dict:
+        """
+        Execute a single automation step by dispatching to the handler for its action.
+        dom_context is the DOM the step was decided on; handlers may use it to skip expensive fallbacks.
+        """
+        action = step.get("action")
+        try:
+            return self._handlers.get(action, self._handle_unknown)(step, dom_context)
+        except Exception as e:
+            return {"status": "error", "message": f"Error executing {action}: {str(e)}"}
+
+    @staticmethod
+    def _target_selector(step: dict) -> str:
+        """The step's DOM selector when it has one, otherwise its descriptive selector parameter."""
+        dom_selector = step.get("dom", "").strip()
+        if dom_selector and dom_selector.upper() != "N/A":
+            return dom_selector
+        return step.get("params", {}).get("selector", "").strip()
+
+    def _handle_navigate(self, step: dict, dom_context=None) -> dict:
+        result = self.controller.navigate(step.get("params", {})["url"])
+        if result["status"] == "success":
+            self._ocr_cache.clear()
+        return result
+
+    def _handle_click(self, step: dict, dom_context=None) -> dict:
         """
-        Execute a single automation step.
         For click actions:
           - First, try clicking using the provided DOM selector.
           - If that fails and vision-based coordinates (coords) are provided, use them.
           - Otherwise, trigger the OCR fallback using the descriptive target text.
         """
-        action = step.get("action")
         params = step.get("params", {})
         # Cleaned DOM selector from get_next_step
         dom_selector = step.get("dom", "").strip()
         # Optional: vision-based coordinates (e.g., {"x": 100, "y": 200})
         coords = step.get("coords")
 
-        try:
-            if action == "navigate":
-                return self.controller.navigate(params["url"])
-
-            elif action == "click":
-                # 1. Try using the DOM-based selector.
-                if dom_selector and dom_selector.upper() != "N/A":
-                    try:
-                        result = self.controller.click(dom_selector)
-                        if result["status"] == "success":
-                            return result
-                        else:
-                            print(f"Click using DOM selector '{dom_selector}' failed: {result.get('message')}")
-                    except Exception as click_exception:
-                        print(f"Click using DOM selector '{dom_selector}' failed: {click_exception}")
-
-                # 2. If vision-based coordinates are provided, try them.
-                if coords and "x" in coords and "y" in coords:
-                    print(f"Using vision-based coordinates fallback: {coords}")
-                    return self.controller.click_by_coordinates(coords["x"], coords["y"])
-
-                # 3. Fallback to OCR: use the descriptive parameter text to attempt to locate the target via OCR.
-                target_text = params.get("selector", "").strip()
-                if target_text:
-                    print(f"Using OCR fallback to find text: '{target_text}'")
-                    ocr_coords = self.controller.get_target_coordinates_ocr(target_text)
-                    if ocr_coords:
-                        print(f"OCR provided coordinates: {ocr_coords}")
-                        return self.controller.click_by_coordinates(ocr_coords["x"], ocr_coords["y"])
-                    else:
-                        print("OCR fallback did not find the target element.")
-
-                # 4. Last resort: try using the descriptive parameter as a selector.
-                fallback_selector = params.get("selector", "").strip()
-                if fallback_selector:
-                    return self.controller.click(fallback_selector)
+        # 1. Try using the DOM-based selector.
+        if dom_selector and dom_selector.upper() != "N/A":
+            try:
+                result = self.controller.click(dom_selector)
+                if result["status"] == "success":
+                    return result
                 else:
-                    return {"status": "error", "message": "No valid selector provided for click action."}
+                    print(f"Click using DOM selector '{dom_selector}' failed: {result.get('message')}")
+            except Exception as click_exception:
+                print(f"Click using DOM selector '{dom_selector}' failed: {click_exception}")
+
+        # 2. If vision-based coordinates are provided, try them.
+        if coords and "x" in coords and "y" in coords:
+            print(f"Using vision-based coordinates fallback: {coords}")
+            return self.controller.click_by_coordinates(coords["x"], coords["y"])
+
+        # 3. Fallback to OCR: use the descriptive parameter text to attempt to locate the target via OCR.
+        target_text = params.get("selector", "").strip()
+        if target_text and not self._ocr_may_find(target_text, dom_context):
+            self._ocr_stats["skipped"] += 1
+            print(f"Skipping OCR fallback: '{target_text}' is not in the page text and the page has no images.")
+        elif target_text:
+            print(f"Using OCR fallback to find text: '{target_text}'")
+            self._ocr_stats["runs"] += 1
+            ocr_coords = self._get_ocr_coordinates(target_text)
+            if ocr_coords:
+                self._ocr_stats["hits"] += 1
+                print(f"OCR provided coordinates: {ocr_coords} (OCR stats: {self._ocr_stats})")
+                return self.controller.click_by_coordinates(ocr_coords["x"], ocr_coords["y"])
+            else:
+                print(f"OCR fallback did not find the target element. (OCR stats: {self._ocr_stats})")
 
-            elif action == "search":
-                return self.controller.search(params["query"])
+        # 4. Last resort: try using the descriptive parameter as a selector.
+        fallback_selector = params.get("selector", "").strip()
+        if fallback_selector:
+            return self.controller.click(fallback_selector)
+        else:
+            return {"status": "error", "message": "No valid selector provided for click action."}
 
-            elif action == "input":
-                selector = dom_selector if dom_selector and dom_selector.upper() != "N/A" else params.get("selector",
-                                                                                                          "").strip()
-                return self.controller.input_text(selector, params["text"])
+    def _handle_search(self, step: dict, dom_context=None) -> dict:
+        return self.controller.search(step.get("params", {})["query"])
 
-            elif action == "extract":
-                selector = dom_selector if dom_selector and dom_selector.upper() != "N/A" else params.get("selector",
-                                                                                                          "").strip()
-                return self.controller.extract(selector)
+    def _handle_input(self, step: dict, dom_context=None) -> dict:
+        return self.controller.input_text(self._target_selector(step), step.get("params", {})["text"])
 
-            elif action == "wait":
-                seconds = int(params.get("seconds", 2))
-                time.sleep(seconds)
-                return {"status": "success", "message": f"Waited {seconds} seconds"}
+    def _handle_extract(self, step: dict, dom_context=None) -> dict:
+        return self.controller.extract(self._target_selector(step))
 
-            elif action == "complete":
-                return {"status": "success", "message": "Task completed successfully"}
+    def _handle_wait(self, step: dict, dom_context=None) -> dict:
+        seconds = int(step.get("params", {}).get("seconds", 2))
+        time.sleep(seconds)
+        return {"status": "success", "message": f"Waited {seconds} seconds"}
 
-            else:
-                return {"status": "error", "message": f"Unknown action: {action}"}
+    def _handle_complete(self, step: dict, dom_context=None) -> dict:
+        return {"status": "success", "message": "Task completed successfully"}
 
-        except Exception as e:
-            return {"status": "error", "message": f"Error executing {action}: {str(e)}"}
+    def _handle_unknown(self, step: dict, dom_context=None) -> dict:
+        return {"status": "error", "message": f"Unknown action: {step.get('action')}"}
 
     def _attempt_recovery(self, failed_step, error_result, step_index, all_steps):
         """Try to recover from common errors."""
@@ -111,7 +170,7 @@ class CommandExecutor:
         # Case 1: Element not found - try waiting and retrying
         if "not found" in error_msg and action in ["click", "input", "extract"]:
             print(f"Recovery attempt: Waiting for element to appear...")
-            time.sleep(3)
+            self.controller.wait_for_ready()
             retry_result = self._execute_step(failed_step)
             if retry_result["status"] == "success":
                 return retry_result
@@ -127,7 +186,31 @@ class CommandExecutor:
         # No recovery possible
         return None
 
-    def execute_command_iteratively(self, command_text: str) -> Dict[str, Any]:
+    async def _settle_and_refresh(self, command_text: str, dom_context, last_step, speculate=True,
+                                  previous_document=None):
+        """
+        Wait for the page to settle, then fetch the fresh DOM. With speculate set, the next LLM plan is
+        requested on the current (possibly stale) DOM meanwhile. previous_document is the document token
+        taken before a step that may navigate, so the pre-navigation page is not mistaken for the new one.
+        Returns ((llm_task, fingerprint of the DOM it used) or None, fresh DOM).
+        """
+        speculative = None
+        if speculate:
+            llm_task = asyncio.create_task(self.parser.get_next_steps(command_text, dom_context, last_step))
+            speculative = (llm_task, dom_fingerprint(dom_context))
+        # Allow page to load
+        await asyncio.to_thread(self.controller.wait_for_ready, previous_document=previous_document)
+        fresh_dom = await asyncio.to_thread(self.controller.get_dom_context)
+        return speculative, fresh_dom
+
+    def _planned_step_still_valid(self, step: dict) -> bool:
+        """A planned step is only executed if the element it targets is still on the page."""
+        dom_selector = step.get("dom", "").strip()
+        if not dom_selector or dom_selector.upper() == "N/A":
+            return True
+        return self.controller.find_element(dom_selector) is not None
+
+    async def execute_command_iteratively(self, command_text: str) -> Dict[str, Any]:
         """Execute a natural language command iteratively based on DOM context."""
         try:
             # Ensure connection
@@ -138,13 +221,23 @@ class CommandExecutor:
 
             # Execute steps iteratively
             results = []
+            last_step = None
             max_steps = 15
             consecutive_failures = 0
             max_failures = 3  # Max number of consecutive failures before giving up
+            # LLM plan started on the previous DOM while the page was settling: (task, DOM fingerprint)
+            speculative = None
+            # Remaining steps from the last look-ahead plan
+            pending_plan = deque()
+            dom_context = None
+            # Outcome bookkeeping, kept up to date as results are appended
+            saw_complete = False
+            failed_steps = 0
 
             for i in range(max_steps):
-                # Get current DOM state
-                dom_context = self.controller.get_dom_context()
+                # Get current DOM state (already fetched if the page was settled after the last step)
+                if dom_context is None:
+                    dom_context = self.controller.get_dom_context()
 
                 # Log current page state
                 print(f"\n--- Step {i + 1}: Analyzing current page ---")
@@ -152,34 +245,65 @@ class CommandExecutor:
                 print(f"Current URL: {current_url}")
                 print(f"Found {len(dom_context)} interactive elements")
 
-                # Get next step from LLM
-                next_step = self.parser.get_next_step(command_text, dom_context, results)
-                print(next_step)
+                # Take the next planned step while its target is still on the page
+                next_step = None
+                if pending_plan:
+                    planned_step = pending_plan.popleft()
+                    if self._planned_step_still_valid(planned_step):
+                        next_step = planned_step
+                        print(f"Using planned step ({len(pending_plan)} more planned)")
+                    else:
+                        print("Planned step no longer matches the page, re-planning")
+                        pending_plan.clear()
+
+                # Otherwise get a new plan from the LLM, reusing the speculative one if the DOM did not change
+                if next_step is None:
+                    if speculative is not None:
+                        llm_task, stale_fingerprint = speculative
+                        speculative = None
+                        if dom_fingerprint(dom_context) == stale_fingerprint:
+                            plan = await llm_task
+                        else:
+                            llm_task.cancel()
+                            plan = await self.parser.get_next_steps(command_text, dom_context, last_step)
+                    else:
+                        plan = await self.parser.get_next_steps(command_text, dom_context, last_step)
 
-                if not next_step:
-                    print("Failed to determine next step")
-                    break
+                    if not plan:
+                        print("Failed to determine next step")
+                        break
+                    next_step = plan[0]
+                    pending_plan.extend(plan[1:])
+                print(next_step)
 
                 if next_step.get("action") == "complete":
                     print("Task completed successfully")
+                    saw_complete = True
                     message = next_step.get("params", {}).get("message", "Task completed")
                     results.append({"status": "success", "message": message})
                     break
 
-                # Execute the step
+                # Execute the step; clicks return before any navigation they start, so note the current document
                 print(f"Executing: {next_step['action']} {next_step.get('params', {})}")
-                result = self._execute_step(next_step)
+                previous_document = self.controller.document_token() if next_step["action"] == "click" else None
+                result = self._execute_step(next_step, dom_context)
                 results.append(result)
+                last_step = result
+                if result["status"] != "success":
+                    failed_steps += 1
 
                 # Handle success/failure
                 if result["status"] == "success":
                     consecutive_failures = 0
                     print(f"Success: {result['message']}")
-                    # Allow page to load
-                    time.sleep(1.5)
+                    speculative, dom_context = await self._settle_and_refresh(
+                        command_text, dom_context, last_step, speculate=not pending_plan,
+                        previous_document=previous_document)
                 else:
                     consecutive_failures += 1
                     print(f"Failed: {result['message']}")
+                    # The rest of the plan assumed this step would succeed
+                    pending_plan.clear()
 
                     # Try recovery
                     if consecutive_failures < max_failures:
@@ -187,18 +311,25 @@ class CommandExecutor:
                         recovered = self._attempt_recovery(next_step, result, i, [])
                         if recovered:
                             results[-1] = recovered
+                            last_step = recovered
+                            if recovered["status"] == "success":
+                                failed_steps -= 1
                             consecutive_failures = 0
                             print(f"Recovery succeeded: {recovered['message']}")
-                            time.sleep(1.5)
+                            speculative, dom_context = await self._settle_and_refresh(
+                                command_text, dom_context, last_step, previous_document=previous_document)
                         else:
                             print("Recovery failed")
+                            dom_context = None
                     else:
                         print(f"Exceeded maximum consecutive failures ({max_failures}), stopping execution")
                         break
 
+            if speculative is not None:
+                speculative[0].cancel()
+
             return {
-                "status": "success" if any(r.get("action") == "complete" for r in results) or all(
-                    r["status"] == "success" for r in results) else "error",
+                "status": "success" if saw_complete or failed_steps == 0 else "error",
                 "steps_completed": len(results),
                 "total_steps": len(results),
                 "results": results
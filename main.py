@@ -1,13 +1,21 @@
 import argparse
+import asyncio
+import sqlite3
 import threading
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, request
+from waitress import serve
 from controller.marionette_controller import EnhancedMarionetteController
 from executor.command_executor import CommandExecutor
-from tinydb import TinyDB
 import time
 
 app = Flask(__name__)
-db = TinyDB('dom_context.json')
+# SQLite in WAL mode appends one row per extraction instead of rewriting a whole JSON file.
+db = sqlite3.connect('dom_context.db', isolation_level=None, check_same_thread=False)
+db.execute("PRAGMA journal_mode=WAL")
+db.execute("PRAGMA synchronous=NORMAL")
+db.execute("CREATE TABLE IF NOT EXISTS dom (ts REAL, url TEXT, max_elements INTEGER, dom_json TEXT)")
+db_lock = threading.Lock()
 # Create a controller instance for the API.
 controller = EnhancedMarionetteController(host="localhost", port=2828)
 
@@ -19,22 +27,26 @@ def extract_dom_context():
     try:
         dom_context = controller.get_full_dom_context()
         current_url = controller.client.get_url() if controller.client else "Unknown"
-        entry = {
-            "timestamp": time.time(),
-            "url": current_url,
-            "max_elements": max_elements,
-            "dom_context": dom_context
-        }
-        db.insert(entry)
-        return jsonify({
-            "status": "success",
-            "dom_context": dom_context
-        })
+        # Encode the DOM once and reuse the bytes for both the stored row and the response body.
+        dom_json = orjson.dumps(dom_context)
+        with db_lock:
+            db.execute(
+                "INSERT INTO dom(ts, url, max_elements, dom_json) VALUES (?, ?, ?, ?)",
+                (time.time(), current_url, max_elements, dom_json.decode())
+            )
+        return app.response_class(
+            b'{"status":"success","dom_context":' + dom_json + b'}',
+            mimetype="application/json"
+        )
     except Exception as e:
-        return jsonify({
-            "status": "error",
-            "message": str(e)
-        }), 500
+        return app.response_class(
+            orjson.dumps({
+                "status": "error",
+                "message": str(e)
+            }),
+            status=500,
+            mimetype="application/json"
+        )
 
 
 def main():
@@ -57,6 +69,9 @@ def main():
 
     print("Connected to Firefox. Enter commands or 'exit' to quit.")
 
+    # A single event loop for the session, so the async LLM client's connections are reused across commands.
+    loop = asyncio.new_event_loop()
+
     # Main command loop.
     while True:
         command = input("\nEnter command: ")
@@ -64,7 +79,7 @@ def main():
             break
 
         print("Executing command...")
-        result = executor.execute_command_iteratively(command)
+        result = loop.run_until_complete(executor.execute_command_iteratively(command))
 
         # Display results.
         if result["status"] == "success":
@@ -83,9 +98,12 @@ def main():
                 else:
                     print(f"    Extracted data: {data}")
 
+    loop.close()
+
 
 if __name__ == "__main__":
-    flask_thread = threading.Thread(target=lambda: app.run(host="0.0.0.0", port=5001, threaded=True))
+    # Serve the API with waitress (production WSGI server) rather than the Werkzeug dev server.
+    flask_thread = threading.Thread(target=lambda: serve(app, host="0.0.0.0", port=5001, threads=8))
     flask_thread.daemon = True
     flask_thread.start()
 
@@ -1,48 +1,254 @@
+import collections
+import hashlib
+import heapq
+import io
+import os
 import re
-from openai import OpenAI
+
+import diskcache
+import httpx
+import orjson
+from openai import AsyncOpenAI
+
+# Patterns used to decode the LLM response, compiled once at import time.
+_ACTION_RE = re.compile(r'ACTION:\s*([A-F])')
+_PARAM_RE = re.compile(r'PARAM:\s*(.*?)(?:\n|$)')
+_DOM_RE = re.compile(r'DOM:\s*(.*?)(?:\n|$)')
+_DOM_LINE_DONE_RE = re.compile(r'DOM:\s*(.*?)\n')
+_DOM_TAIL_RE = re.compile(r'\s*\(.*\)$')
+_DIGIT_RE = re.compile(r'\d+')
+_WORD_RE = re.compile(r'\w+')
+
+# Attributes included in the DOM summary, in output order.
+_ATTR_KEYS = ('id', 'name', 'class', 'placeholder', 'aria-label', 'title', 'href')
+# Element text and attribute values are clipped to this many characters to keep the prompt small.
+_MAX_VALUE_LEN = 60
+# Tags that are scored as likely interaction targets when pruning the DOM context.
+_INTERACTIVE_TAGS = frozenset({'input', 'button', 'a', 'select', 'textarea'})
+
+
+def _rank_dom(dom_context, goal: str, k: int = 40):
+    """
+    Keep the k elements most likely to matter for the goal: interactive tags score 2,
+    plus one per word shared between the element text and the goal. Page order is preserved.
+    """
+    if not isinstance(dom_context, list) or len(dom_context) <= k:
+        return dom_context
+
+    goal_tokens = frozenset(_WORD_RE.findall(goal.lower()))
+
+    def score(item):
+        element = item[1]
+        overlap = len(goal_tokens.intersection(_WORD_RE.findall((element.get("text") or "").lower())))
+        return (element.get("tag") in _INTERACTIVE_TAGS) * 2 + overlap
+
+    top = heapq.nlargest(k, enumerate(dom_context), key=score)
+    return [element for _, element in sorted(top, key=lambda item: item[0])]
+
+
+def _clip(value: str, n: int = _MAX_VALUE_LEN) -> str:
+    """Return value unchanged if it fits in n characters, otherwise its first n-1 characters plus an ellipsis."""
+    return value if len(value) <= n else value[:n - 1] + "…"
+
+
+def _summarize_dom(dom_context) -> str:
+    """
+    Format the DOM context as one line per element: tag, text and any non-empty key attributes.
+    Identical lines are emitted once, in first-seen order, with an " xN" count suffix.
+    """
+    if not (isinstance(dom_context, list) and dom_context):
+        return "No interactive elements found."
+
+    counts = collections.Counter()
+    for element in dom_context:
+        get_attr = (element.get("attributes") or {}).get
+        text = _clip(element.get("text", "").strip())
+        # Non-string attribute values (e.g. SVG className objects) are stringified so the key is hashable.
+        # Values are clipped here, so long hrefs and class lists that differ only in their tails dedupe.
+        attr_values = tuple(
+            value if value is None else _clip(value if isinstance(value, str) else str(value))
+            for value in map(get_attr, _ATTR_KEYS)
+        )
+        counts[(element.get("tag", ""), text, attr_values)] += 1
+
+    buf = io.StringIO()
+    write = buf.write
+    for n, ((tag, text, attr_values), count) in enumerate(counts.items()):
+        if n:
+            write("\n")
+        write(f"{tag}: '{text}'")
+        attr_list = [f"{key}='{value}'" for key, value in zip(_ATTR_KEYS, attr_values) if value]
+        if attr_list:
+            write(" (" + ", ".join(attr_list) + ")")
+        if count > 1:
+            write(f" x{count}")
+    return buf.getvalue()
+
+
+def _parse_navigate(param_value: str) -> dict:
+    if param_value and not param_value.startswith(('http://', 'https://')):
+        param_value = 'https://' + param_value
+    return {'url': param_value}
+
+
+def _parse_search(param_value: str) -> dict:
+    return {'query': param_value}
+
+
+def _parse_click(param_value: str) -> dict:
+    # For clicks, we expect a descriptive target text.
+    return {'selector': param_value}
+
+
+def _parse_input(param_value: str) -> dict:
+    parts = param_value.split(',', 1)
+    if len(parts) >= 2:
+        return {'selector': parts[0].strip(), 'text': parts[1].strip()}
+    return {'selector': "input field", 'text': param_value}
+
+
+def _parse_wait(param_value: str) -> dict:
+    match = _DIGIT_RE.search(param_value)
+    return {'seconds': int(match.group(0)) if match else 3}
+
+
+def _parse_complete(param_value: str) -> dict:
+    return {}
+
+
+# Action letter -> (action name, parser turning the PARAM value into the step's params dict).
+_DISPATCH = {
+    'A': ('navigate', _parse_navigate),
+    'B': ('search', _parse_search),
+    'C': ('click', _parse_click),
+    'D': ('input', _parse_input),
+    'E': ('wait', _parse_wait),
+    'F': ('complete', _parse_complete),
+}
+
+# Full action names -> letters, for JSON responses that spell the action out.
+_ACTION_LETTERS = {name: letter for letter, (name, _) in _DISPATCH.items()}
+
+# Maximum number of steps accepted from a single look-ahead plan.
+_MAX_PLAN_STEPS = 4
+
+
+def _json_step_fields(obj):
+    """
+    Return (action_letter, param, dom) from one decoded JSON step, or None if it is malformed.
+    The action may be a single dispatch letter or a full action name such as "complete".
+    """
+    try:
+        action = str(obj["action"]).strip()
+        param_value = str(obj.get("param") or "").strip()
+        dom_value = str(obj.get("dom") or "N/A").strip()
+    except (KeyError, TypeError, AttributeError):
+        return None
+    action_letter = action.upper() if action.upper() in _DISPATCH else _ACTION_LETTERS.get(action.lower())
+    if action_letter is None:
+        return None
+    return action_letter, param_value, dom_value
+
+
+def _parse_json_plan(response_text: str):
+    """
+    Return a list of (action_letter, param, dom) from a JSON-mode response: either {"plan": [...]}
+    or a single step object. Returns None if the response is not valid JSON or holds no valid step.
+    """
+    try:
+        obj = orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        return None
+    items = obj["plan"] if isinstance(obj, dict) and isinstance(obj.get("plan"), list) else [obj]
+    plan = []
+    for item in items[:_MAX_PLAN_STEPS]:
+        fields = _json_step_fields(item)
+        if fields is None:
+            break
+        plan.append(fields)
+    return plan or None
+
+
+def _parse_labelled_fields(response_text: str):
+    """Return (action_letter, param, dom) from an ACTION:/PARAM:/DOM: response, or None."""
+    action_match = _ACTION_RE.search(response_text)
+    param_match = _PARAM_RE.search(response_text)
+    if not (action_match and param_match):
+        return None
+    dom_match = _DOM_RE.search(response_text)
+    # Remove trailing commentary from the DOM field, if any.
+    dom_value = _DOM_TAIL_RE.sub('', dom_match.group(1).strip()) if dom_match else "N/A"
+    return action_match.group(1), param_match.group(1).strip(), dom_value
+
+
+def dom_fingerprint(dom_context) -> bytes:
+    """Hash a canonical form of the DOM context (tag, stripped text, sorted non-empty attributes)."""
+    canonical_dom = []
+    if isinstance(dom_context, list):
+        for element in dom_context:
+            attrs = element.get("attributes") or {}
+            canonical_dom.append([
+                element.get("tag", ""),
+                (element.get("text") or "").strip(),
+                sorted((k, v) for k, v in attrs.items() if v),
+            ])
+    return hashlib.blake2b(orjson.dumps(canonical_dom), digest_size=16).digest()
 
 
 class CommandParser:
     """Parse natural language commands for browser automation using only LLM (DeepSeek/OpenAI API)."""
 
-    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat"):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat",
+                 cache_dir: str = ".llm_cache"):
+        # Keep TLS connections alive across steps and multiplex requests over HTTP/2.
+        http_client = httpx.AsyncClient(
+            # Limits go on the transport: AsyncClient ignores its own limits= when given a transport.
+            transport=httpx.AsyncHTTPTransport(
+                http2=True, retries=2,
+                limits=httpx.Limits(max_keepalive_connections=8, keepalive_expiry=60.0),
+            ),
+            timeout=30.0,
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
         self.model = model
+        # On-disk LRU of decoded decisions keyed by (goal, DOM fingerprint, last action).
+        self._cache = diskcache.Cache(cache_dir, size_limit=64 * 2 ** 20, eviction_policy="least-recently-used")
+
+    @staticmethod
+    def _cache_key(goal: str, dom_context, last_action: str) -> str:
+        """Stable hash of the goal, the DOM fingerprint and the last action."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(goal.encode())
+        digest.update(dom_fingerprint(dom_context))
+        digest.update(last_action.encode())
+        return digest.hexdigest()
 
-    def get_next_step(self, goal: str, dom_context=None, previous_steps=None):
+    async def get_next_steps(self, goal: str, dom_context=None, last_step=None):
         """
-        Generate the next action to achieve the goal based on current context.
+        Generate the next action(s) to achieve the goal based on current context, as a list of
+        up to _MAX_PLAN_STEPS steps the caller can execute in order until one fails.
         The prompt instructs the LLM to only return action F ("complete") if the page's state (e.g. URL)
         indicates that the desired final state is achieved.
         """
-        # Build a formatted summary string from the DOM context.
-        dom_lines = []
-        if isinstance(dom_context, list) and dom_context:
-            for element in dom_context:
-                tag = element.get("tag", "")
-                text = element.get("text", "").strip()
-                attrs = element.get("attributes", {})
-                attr_list = []
-                for key in ['id', 'name', 'class', 'placeholder', 'aria-label', 'title', 'href']:
-                    if attrs.get(key):
-                        attr_list.append(f"{key}='{attrs[key]}'")
-                line = f"{tag}: '{text}'"
-                if attr_list:
-                    line += " (" + ", ".join(attr_list) + ")"
-                dom_lines.append(line)
-        else:
-            dom_lines.append("No interactive elements found.")
-        dom_context_str = "\n".join(dom_lines)
-
-        # Get current URL and last action from previous steps (if available)
+        # Get current URL and last action from the previous step result (if available)
         current_url = "Unknown"
         last_action = "None"
-        if previous_steps and len(previous_steps) > 0:
-            last_step = previous_steps[-1]
+        if last_step:
             if "Navigated to" in last_step.get("message", ""):
                 current_url = last_step.get("message", "").replace("Navigated to ", "")
             last_action = last_step.get("message", "")
 
+        # Identical goal, page and last action: reuse the earlier decision instead of calling the LLM.
+        cache_key = self._cache_key(goal, dom_context, last_action)
+        cached = self._cache.get(cache_key)
+        if isinstance(cached, list):
+            print("\nLLM decision (cached):", cached)
+            return cached
+
+        # Build a formatted summary string from the most relevant part of the DOM context.
+        # The full list is still used for the cache key above.
+        dom_context_str = _summarize_dom(_rank_dom(dom_context, goal))
+
         # Build the prompt with explicit instructions about final state.
         prompt = f"""GOAL: {goal}
 
@@ -56,8 +262,10 @@ IMPORTANT: The task is only considered complete when the page's final state conf
 For example, if the goal is to click a button on the Google homepage ("https://www.google.com") that redirects you to another URL, 
 then the final state is achieved only if the current URL is different from "https://www.google.com".
 
-Based solely on the above context, decide the next single action needed to achieve the goal.
-Choose exactly one action from:
+Based solely on the above context, decide the next action needed to achieve the goal.
+If the actions after it can already be predicted from this page (e.g. input a query, then click the submit button),
+plan up to 4 consecutive actions; otherwise plan just one. Stop the plan at any action that changes the page unpredictably.
+Choose each action from:
 A) navigate - Navigate to a URL.
 B) search - Enter a search query.
 C) click - Click on a specific element.
@@ -65,95 +273,101 @@ D) input - Type text into a field.
 E) wait - Wait for a specified duration.
 F) complete - No further action is needed; the desired final state is achieved (i.e. the current URL or state confirms redirection).
 
-For your chosen action, please provide:
+For each planned action, please provide:
 - The necessary parameter(s) (e.g., URL for navigate, query for search, text for input).
 - The exact CSS selector (DOM element) from the above summary on which to perform the action, or "N/A" if not applicable.
 - If the final state is confirmed (e.g., the current URL is different from the original), return action F ("complete") with an appropriate message including the new URL.
 
-Format your response exactly as follows:
-ACTION: [Letter]
-PARAM: [Parameter(s)]
-DOM: [Exact CSS selector or "N/A"]
+Respond with a single JSON object, exactly in this format:
+{{"plan": [{{"action": "[Letter]", "param": "[Parameter(s)]", "dom": "[Exact CSS selector or N/A]"}}, ...]}}
 
 Example if final state is reached:
-ACTION: F
-PARAM: Task completed – redirection confirmed (current URL: https://example.com/newpage)
-DOM: N/A
+{{"plan": [{{"action": "F", "param": "Task completed – redirection confirmed (current URL: https://example.com/newpage)", "dom": "N/A"}}]}}
 """
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "You are a helpful assistant for browser automation."},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=150,
+                max_tokens=240,
                 temperature=0.1,
                 top_p=0.95,
-                stream=False,
-                stop=["Input:", "##"]
+                stream=True,
+                stop=["Input:", "##"],
+                response_format={"type": "json_object"},
+                # The response keys are fixed, so supply them as a prediction; backends without
+                # Predicted Outputs support simply ignore it. Sent via extra_body because the pinned
+                # openai client has no prediction= keyword.
+                extra_body={
+                    "prediction": {"type": "content", "content": '{"plan": [{"action": "", "param": "", "dom": ""}]}'}
+                }
             )
-            response_text = response.choices[0].message.content.strip()
+            # Stream the completion and stop as soon as a complete answer is in (a closed JSON object,
+            # or ACTION plus a finished DOM line), so the remaining tokens are never generated.
+            response_text = ""
+            try:
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    response_text += delta
+                    if ("}" in delta and _parse_json_plan(response_text)) or \
+                            ("\n" in delta and _ACTION_RE.search(response_text)
+                             and _DOM_LINE_DONE_RE.search(response_text)):
+                        break
+            finally:
+                await response.close()
+            response_text = response_text.strip()
             print("\nLLM decision:")
             print("----------------------------------------")
             print(response_text)
             print("----------------------------------------")
 
-            # Extract fields from the LLM response.
-            action_match = re.search(r'ACTION:\s*([A-F])', response_text)
-            param_match = re.search(r'PARAM:\s*(.*?)(?:\n|$)', response_text)
-            dom_match = re.search(r'DOM:\s*(.*?)(?:\n|$)', response_text)
-
-            if action_match and param_match:
-                action_letter = action_match.group(1)
-                param_value = param_match.group(1).strip()
-                # Remove trailing commentary from the DOM field, if any.
-                if dom_match:
-                    dom_value = re.sub(r'\s*\(.*\)$', '', dom_match.group(1).strip())
-                else:
-                    dom_value = "N/A"
-
-                action_map = {
-                    'A': 'navigate',
-                    'B': 'search',
-                    'C': 'click',
-                    'D': 'input',
-                    'E': 'wait',
-                    'F': 'complete'
-                }
-                action = action_map.get(action_letter)
-                if not action:
-                    print(f"Invalid action letter: {action_letter}")
-                    return None
+            # Extract fields from the LLM response: JSON plan first, labelled lines (single step) as a fallback.
+            plan = _parse_json_plan(response_text)
+            if plan is None:
+                fields = _parse_labelled_fields(response_text)
+                plan = [fields] if fields else None
 
-                params_dict = {}
-                if action == 'navigate':
-                    if param_value and not param_value.startswith(('http://', 'https://')):
-                        param_value = 'https://' + param_value
-                    params_dict['url'] = param_value
-                elif action == 'search':
-                    params_dict['query'] = param_value
-                elif action == 'click':
-                    # For clicks, we expect a descriptive target text.
-                    params_dict['selector'] = param_value
-                elif action == 'input':
-                    parts = param_value.split(',', 1)
-                    if len(parts) >= 2:
-                        params_dict['selector'] = parts[0].strip()
-                        params_dict['text'] = parts[1].strip()
-                    else:
-                        params_dict['selector'] = "input field"
-                        params_dict['text'] = param_value
-                elif action == 'wait':
+            if plan:
+                steps = []
+                for action_letter, param_value, dom_value in plan:
                     try:
-                        params_dict['seconds'] = int(re.search(r'\d+', param_value).group(0))
-                    except:
-                        params_dict['seconds'] = 3
+                        action, parse_params = _DISPATCH[action_letter]
+                    except KeyError:
+                        print(f"Invalid action letter: {action_letter}")
+                        break
+                    steps.append({"action": action, "params": parse_params(param_value), "dom": dom_value})
+                    # Nothing can follow completion.
+                    if action == 'complete':
+                        break
+                if not steps:
+                    return None
 
-                return {"action": action, "params": params_dict, "dom": dom_value}
+                self._cache.set(cache_key, steps)
+                return steps
             else:
                 print("Failed to extract fields from LLM response.")
                 return None
         except Exception as e:
-            print(f"Error in get_next_step: {e}")
+            print(f"Error in get_next_steps: {e}")
             return None
+
+
+# Process-wide parser, so the HTTP/2 connection pool and the decision cache are shared.
+_PARSER_SINGLETON = None
+
+
+def get_parser(api_key: str = None) -> CommandParser:
+    """
+    Return the shared CommandParser, creating it on first use.
+    The API key defaults to the DEEPSEEK_API_KEY environment variable.
+    """
+    global _PARSER_SINGLETON
+    if _PARSER_SINGLETON is None:
+        _PARSER_SINGLETON = CommandParser(api_key=api_key or os.environ.get("DEEPSEEK_API_KEY"))
+    return _PARSER_SINGLETON